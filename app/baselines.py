@@ -7,58 +7,68 @@ from .models import TeamFeature, TeamDefFeature, SeasonFeatureBaseline
 
 logger = logging.getLogger(__name__)
 
-def compute_and_store_baselines(db: Session, season: str, window: int = 10):
+# Baselines only change when compute_and_store_baselines runs, so memoize them per (season, window)
+_baselines_cache: dict[tuple[str, int], dict[str, dict[str, float]]] = {}
+_baseline_arrays_cache: dict[tuple[str, int], tuple[dict[str, int], np.ndarray, np.ndarray]] = {}
+
+def compute_and_store_baselines(db: Session, season: str, window: int = 10) -> dict:
     """
     Computes mean, std, and percentiles for all offensive and defensive features.
     Stores them in SeasonFeatureBaseline table.
     """
     logger.info(f"Computing baselines for {season}, window {window}")
     
-    # 1. Fetch Offensive Features
+    # 1. Fetch Offensive Features (read straight into a DataFrame, no ORM hydration)
     off_query = select(TeamFeature).filter(TeamFeature.season == season, TeamFeature.window == window)
-    off_data = db.execute(off_query).scalars().all()
+    off_df = pd.read_sql(off_query, db.bind)
     
     # 2. Fetch Defensive Features
     def_query = select(TeamDefFeature).filter(TeamDefFeature.season == season, TeamDefFeature.window == window)
-    def_data = db.execute(def_query).scalars().all()
+    def_df = pd.read_sql(def_query, db.bind)
     
-    if not off_data or not def_data:
+    if off_df.empty or def_df.empty:
         logger.warning("Insufficient data to compute baselines.")
         return {"error": "Insufficient data"}
 
-    # Convert to DataFrames
-    off_df = pd.DataFrame([{col.name: getattr(row, col.name) for col in TeamFeature.__table__.columns} for row in off_data])
-    def_df = pd.DataFrame([{col.name: getattr(row, col.name) for col in TeamDefFeature.__table__.columns} for row in def_data])
-
     # Columns to ignore
     ignore = ['id', 'team_id', 'as_of_date', 'season', 'window', 'games_used']
     
-    baseline_objects = []
+    baseline_frames = []
 
     def process_df(df):
-        for col in df.columns:
-            if col in ignore:
-                continue
-            
-            series = df[col].dropna()
-            if series.empty:
-                continue
-            
-            p = np.percentile(series, [10, 25, 50, 75, 90])
-            
-            baseline = SeasonFeatureBaseline(
-                season=season,
-                window=window,
-                feature_name=col,
-                mean=float(series.mean()),
-                std=float(series.std()),
-                p10=float(p[0]),
-                p25=float(p[1]),
-                p50=float(p[2]),
-                p75=float(p[3]),
-                p90=float(p[4])
-            )
-            baseline_objects.append(baseline)
+        cols = [c for c in df.columns if c not in ignore]
+        arr = df[cols].to_numpy(dtype=np.float64)
+
+        # Skip features with no data at all
+        has_data = ~np.isnan(arr).all(axis=0)
+        cols = [c for c, keep in zip(cols, has_data) if keep]
+        arr = arr[:, has_data]
+        if not cols:
+            return
+
+        means = np.nanmean(arr, axis=0)
+        stds = np.nanstd(arr, axis=0, ddof=1)
+
+        # np.quantile partitions every column in one C-level pass; the nan-aware
+        # variant falls back to per-column work, so only use it when there are gaps
+        q = np.array([0.10, 0.25, 0.50, 0.75, 0.90])
+        if np.isnan(arr).any():
+            pct = np.nanquantile(arr, q, axis=0)
+        else:
+            pct = np.quantile(arr, q, axis=0, method='linear')
+
+        baseline_frames.append(pd.DataFrame({
+            'season': season,
+            'window': window,
+            'feature_name': cols,
+            'mean': means,
+            'std': stds,
+            'p10': pct[0],
+            'p25': pct[1],
+            'p50': pct[2],
+            'p75': pct[3],
+            'p90': pct[4],
+        }))
 
     process_df(off_df)
     process_df(def_df)
@@ -69,19 +79,33 @@ def compute_and_store_baselines(db: Session, season: str, window: int = 10):
         SeasonFeatureBaseline.window == window
     ))
     
-    db.bulk_save_objects(baseline_objects)
+    # One multi-row INSERT per chunk on the session's connection, so the delete
+    # above and the new rows still commit together
+    baseline_df = pd.concat(baseline_frames, ignore_index=True) if baseline_frames else pd.DataFrame()
+    if not baseline_df.empty:
+        baseline_df.to_sql(
+            SeasonFeatureBaseline.__tablename__, db.connection(),
+            if_exists='append', index=False, method='multi', chunksize=5000
+        )
     db.commit()
+    _baselines_cache.pop((season, window), None)
+    _baseline_arrays_cache.pop((season, window), None)
     
     return {
         "season": season,
         "window": window,
-        "features_computed": len(baseline_objects)
+        "features_computed": len(baseline_df)
     }
 
-def get_baselines_dict(db: Session, season: str, window: int):
+def get_baselines_dict(db: Session, season: str, window: int) -> dict[str, dict[str, float]]:
     """
     Returns baselines as a nested dict: {feature_name: {mean, std, ...}}
+    Served from the in-process cache after the first (non-empty) load.
     """
+    cached = _baselines_cache.get((season, window))
+    if cached is not None:
+        return cached
+
     baselines = db.execute(
         select(SeasonFeatureBaseline).where(
             SeasonFeatureBaseline.season == season,
@@ -89,7 +113,7 @@ def get_baselines_dict(db: Session, season: str, window: int):
         )
     ).scalars().all()
     
-    return {b.feature_name: {
+    baselines_dict = {b.feature_name: {
         "mean": b.mean,
         "std": b.std,
         "p10": b.p10,
@@ -99,3 +123,30 @@ def get_baselines_dict(db: Session, season: str, window: int):
         "p90": b.p90
     } for b in baselines}
 
+    if baselines_dict:
+        _baselines_cache[(season, window)] = baselines_dict
+    return baselines_dict
+
+def baseline_arrays(baselines: dict[str, dict[str, float]]) -> tuple[dict[str, int], np.ndarray, np.ndarray]:
+    """
+    Aligns a baselines dict into ({feature_name: position}, means, stds) arrays.
+    """
+    feature_idx = {name: i for i, name in enumerate(baselines)}
+    means = np.array([b['mean'] for b in baselines.values()], dtype=np.float64)
+    stds = np.array([b['std'] for b in baselines.values()], dtype=np.float64)
+    return feature_idx, means, stds
+
+def get_baseline_arrays(db: Session, season: str, window: int) -> tuple[dict[str, int], np.ndarray, np.ndarray]:
+    """
+    Returns the baselines for (season, window) as aligned NumPy arrays (see baseline_arrays).
+    Cached alongside the dict form.
+    """
+    cached = _baseline_arrays_cache.get((season, window))
+    if cached is not None:
+        return cached
+
+    baselines = get_baselines_dict(db, season, window)
+    arrays = baseline_arrays(baselines)
+    if baselines:
+        _baseline_arrays_cache[(season, window)] = arrays
+    return arrays
@@ -1,13 +1,46 @@
 import logging
+from bisect import bisect_left
 from datetime import date
 from sqlalchemy.orm import Session
-from sqlalchemy import select, and_, exists
+from sqlalchemy import select, and_, exists, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from .models import TeamGameLog, TeamDefFeature
+from .features import STAT_COLS, team_bounds, rolling_window_sums, cache_feature_row
 import pandas as pd
+import numpy as np
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# In-process cache of feature-store rows keyed by (team_id, as_of_date, window)
+_def_feature_cache: dict[tuple[int, date, int], dict] = {}
+
+def derive_def_feature_columns(opp_means: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Builds the TeamDefFeature value columns from a (M, 6) array of averaged opponent STAT_COLS.
+    Zero-denominator guards use np.where, so there are no per-row branches.
+    """
+    (avg_opp_pts, avg_opp_fga, avg_opp_fg3a,
+     avg_opp_fta, avg_opp_oreb, avg_opp_tov) = opp_means.T
+
+    # Opponent Possessions = opp_fga - opp_oreb + opp_tov + 0.44 * opp_fta
+    # We compute it per game and then average, or average the components. 
+    # The prompt says: where opp_poss = opp_fga - opp_oreb + opp_tov + 0.44 * opp_fta
+    # We'll use the averages of components to get the rolling average possession.
+    avg_opp_poss = avg_opp_fga - avg_opp_oreb + avg_opp_tov + (0.44 * avg_opp_fta)
+
+    # Avoid division by zero
+    with np.errstate(invalid='ignore', divide='ignore'):
+        def_rate_3pa_allowed = np.where(avg_opp_fga > 0, avg_opp_fg3a / avg_opp_fga, 0.0)
+        def_rate_fta_allowed = np.where(avg_opp_fga > 0, avg_opp_fta / avg_opp_fga, 0.0)
+        def_rate_tov_forced = np.where(avg_opp_poss > 0, avg_opp_tov / avg_opp_poss, 0.0)
+
+    return {
+        "def_avg_pts_allowed": avg_opp_pts,
+        "def_rate_3pa_allowed": def_rate_3pa_allowed,
+        "def_rate_fta_allowed": def_rate_fta_allowed,
+        "def_rate_tov_forced": def_rate_tov_forced
+    }
+
 def compute_defense_features(games: list[TeamGameLog], db: Session, team_id: int, as_of_date: date, season: str, window: int) -> dict:
     """
     Computes rolling defensive features from a list of TeamGameLog objects.
@@ -16,59 +49,39 @@ def compute_defense_features(games: list[TeamGameLog], db: Session, team_id: int
     if not games:
         return None
 
-    opp_data = []
+    # Fetch every opponent log for these games in one round-trip
+    game_ids = [g.game_id for g in games]
+    opp_logs = db.execute(
+        select(TeamGameLog)
+        .filter(TeamGameLog.game_id.in_(game_ids))
+        .filter(TeamGameLog.team_id != team_id)
+    ).scalars().all()
+    opp_by_game = {log.game_id: log for log in opp_logs}
+
+    opp_stats = np.empty((len(games), 6), dtype=np.float64)
+    n_opp = 0
     for g in games:
         # Find the opponent's log for the same game
-        opp_log = db.execute(
-            select(TeamGameLog)
-            .filter(TeamGameLog.game_id == g.game_id)
-            .filter(TeamGameLog.team_id != team_id)
-        ).scalar_one_or_none()
+        opp_log = opp_by_game.get(g.game_id)
 
         if opp_log:
-            opp_data.append({
-                'pts': opp_log.pts,
-                'fga': opp_log.fga,
-                'fg3a': opp_log.fg3a,
-                'fta': opp_log.fta,
-                'oreb': opp_log.oreb,
-                'tov': opp_log.tov
-            })
+            opp_stats[n_opp] = (opp_log.pts, opp_log.fga, opp_log.fg3a, opp_log.fta, opp_log.oreb, opp_log.tov)
+            n_opp += 1
     
-    if not opp_data:
+    if n_opp == 0:
         return None
 
-    df = pd.DataFrame(opp_data)
-    
     # Calculate Opponent Averages (what this team allowed)
-    avg_opp_pts = df['pts'].mean()
-    avg_opp_fga = df['fga'].mean()
-    avg_opp_fg3a = df['fg3a'].mean()
-    avg_opp_fta = df['fta'].mean()
-    avg_opp_oreb = df['oreb'].mean()
-    avg_opp_tov = df['tov'].mean()
-
-    # Opponent Possessions = opp_fga - opp_oreb + opp_tov + 0.44 * opp_fta
-    # We compute it per game and then average, or average the components. 
-    # The prompt says: where opp_poss = opp_fga - opp_oreb + opp_tov + 0.44 * opp_fta
-    # We'll use the averages of components to get the rolling average possession.
-    avg_opp_poss = avg_opp_fga - avg_opp_oreb + avg_opp_tov + (0.44 * avg_opp_fta)
-
-    # Avoid division by zero
-    def_rate_3pa_allowed = avg_opp_fg3a / avg_opp_fga if avg_opp_fga > 0 else 0.0
-    def_rate_fta_allowed = avg_opp_fta / avg_opp_fga if avg_opp_fga > 0 else 0.0
-    def_rate_tov_forced = avg_opp_tov / avg_opp_poss if avg_opp_poss > 0 else 0.0
+    opp_means = np.nanmean(opp_stats[:n_opp], axis=0)
+    columns = derive_def_feature_columns(opp_means.reshape(1, -1))
 
     return {
         "team_id": team_id,
         "as_of_date": as_of_date,
         "season": season,
         "window": window,
-        "games_used": len(df),
-        "def_avg_pts_allowed": float(avg_opp_pts),
-        "def_rate_3pa_allowed": float(def_rate_3pa_allowed),
-        "def_rate_fta_allowed": float(def_rate_fta_allowed),
-        "def_rate_tov_forced": float(def_rate_tov_forced)
+        "games_used": n_opp,
+        **{name: float(col[0]) for name, col in columns.items()}
     }
 
 def build_defense_features_for_season(db: Session, season: str, window: int = 10, min_games: int = 5) -> dict:
@@ -91,56 +104,78 @@ def build_defense_features_for_season(db: Session, season: str, window: int = 10
     inserted_count = 0
     skipped_count = 0
     
-    # Pre-fetch existing signatures
-    existing_sigs = set(
-        db.execute(
-            select(TeamDefFeature.team_id, TeamDefFeature.as_of_date)
-            .filter(TeamDefFeature.window == window)
-        ).all()
+    # Pre-fetch all logs once, sorted per team, and compute every rolling window in one pass
+    logs_df = pd.read_sql(
+        select(TeamGameLog).order_by(TeamGameLog.team_id, TeamGameLog.game_date),
+        db.bind
+    )
+
+    # Align each log with its opponent's box score for the same game (NaN if missing)
+    opp_df = logs_df[['game_id', 'team_id'] + STAT_COLS].rename(columns={'team_id': 'opp_team_id'})
+    paired = logs_df[['game_id', 'team_id']].reset_index().merge(opp_df, on='game_id')
+    paired = paired[paired['team_id'] != paired['opp_team_id']].drop_duplicates('index').set_index('index')
+    opp_stats = paired.reindex(logs_df.index)[STAT_COLS].to_numpy(dtype=np.float64)
+    has_opp = logs_df.index.isin(paired.index).astype(np.float64)
+
+    # Trailing indicator column counts the games in each window with an opponent log
+    team_ids = logs_df['team_id'].to_numpy()
+    team_starts, team_ends = team_bounds(team_ids)
+    sums, counts = rolling_window_sums(
+        np.column_stack([opp_stats, has_opp]), team_starts, team_ends, window
     )
+    with np.errstate(invalid='ignore', divide='ignore'):
+        window_means = sums[:, :-1] / counts[:, :-1]
+    opp_games = sums[:, -1].astype(int)
 
-    batch_buffer = []
-    BATCH_SIZE = 100 # Smaller batch because we do lookups per game
+    game_dates = logs_df['game_date'].tolist()
+    team_blocks = {
+        int(team_ids[start]): (start, game_dates[start:end])
+        for start, end in zip(team_starts, team_ends)
+    }
+
+    # Idempotency is enforced by the (team_id, as_of_date, window) unique constraint:
+    # conflicting rows are dropped by Postgres and RETURNING tells us what was inserted
+    insert_stmt = (
+        pg_insert(TeamDefFeature.__table__)
+        .on_conflict_do_nothing(index_elements=['team_id', 'as_of_date', 'window'])
+        .returning(TeamDefFeature.__table__.c.id)
+    )
 
+    BATCH_SIZE = 10_000 # Plain dict rows via Core executemany; large batches amortize round-trips
+
+    target_rows = []
+    target_keys = []
     for team_id, game_date in targets:
-        if (team_id, game_date) in existing_sigs:
+        # Position of the team's first log on game_date; its window covers strictly earlier games
+        start, dates = team_blocks[team_id]
+        end = bisect_left(dates, game_date)
+
+        if min(end, window) < min_games:
             skipped_count += 1
             continue
 
-        # Get previous games for this team
-        past_games = db.query(TeamGameLog).filter(
-            TeamGameLog.team_id == team_id,
-            TeamGameLog.game_date < game_date
-        ).order_by(TeamGameLog.game_date.desc()).limit(window).all()
+        row = start + end
+        if opp_games[row] > 0:
+            target_rows.append(row)
+            target_keys.append((team_id, game_date, int(opp_games[row])))
 
-        if len(past_games) < min_games:
-            skipped_count += 1
-            continue
+    # Derive every target's feature columns in one vectorized pass
+    out_df = pd.DataFrame(target_keys, columns=['team_id', 'as_of_date', 'games_used'])
+    out_df.insert(2, 'season', season)
+    out_df.insert(3, 'window', window)
+    for name, col in derive_def_feature_columns(window_means[target_rows]).items():
+        out_df[name] = col
 
-        feat_dict = compute_defense_features(past_games, db, team_id, game_date, season, window)
-        if feat_dict:
-            feature_obj = TeamDefFeature(**feat_dict)
-            batch_buffer.append(feature_obj)
-
-        if len(batch_buffer) >= BATCH_SIZE:
-            try:
-                db.bulk_save_objects(batch_buffer)
-                db.commit()
-                inserted_count += len(batch_buffer)
-                batch_buffer = []
-            except Exception as e:
-                db.rollback()
-                logger.error(f"Batch insert error: {e}")
-                raise e
-
-    if batch_buffer:
+    for batch_start in range(0, len(out_df), BATCH_SIZE):
+        batch_buffer = out_df.iloc[batch_start:batch_start + BATCH_SIZE].to_dict('records')
         try:
-            db.bulk_save_objects(batch_buffer)
+            inserted = len(db.execute(insert_stmt, batch_buffer).all())
             db.commit()
-            inserted_count += len(batch_buffer)
+            inserted_count += inserted
+            skipped_count += len(batch_buffer) - inserted # Already present
         except Exception as e:
             db.rollback()
-            logger.error(f"Final batch insert error: {e}")
+            logger.error(f"Batch insert error: {e}")
             raise e
 
     return {
@@ -151,10 +186,29 @@ def build_defense_features_for_season(db: Session, season: str, window: int = 10
         "total_candidates": total_candidates
     }
 
+def _compute_def_features_live(db: Session, team_id: int, as_of_date: date, season: str, window: int) -> dict:
+    """
+    Computes defensive features on-the-fly from the team's last `window` games before as_of_date.
+    """
+    past_games = db.query(TeamGameLog).filter(
+        TeamGameLog.team_id == team_id,
+        TeamGameLog.game_date < as_of_date
+    ).order_by(TeamGameLog.game_date.desc()).limit(window).all()
+    
+    if not past_games:
+        return None
+
+    return compute_defense_features(past_games, db, team_id, as_of_date, season, window)
+
 def get_or_compute_def_features(db: Session, team_id: int, as_of_date: date, season: str, window: int = 10) -> dict:
     """
-    Retrieves defensive features from DB or computes them on-the-fly.
+    Retrieves defensive features from the cache, then DB, or computes them on-the-fly.
     """
+    key = (team_id, as_of_date, window)
+    cached = _def_feature_cache.get(key)
+    if cached is not None:
+        return cached
+
     feat = db.scalar(
         select(TeamDefFeature).where(
             TeamDefFeature.team_id == team_id,
@@ -164,15 +218,42 @@ def get_or_compute_def_features(db: Session, team_id: int, as_of_date: date, sea
     )
     
     if feat:
-        return {c.name: getattr(feat, c.name) for c in TeamDefFeature.__table__.columns}
+        feat_dict = {c.name: getattr(feat, c.name) for c in TeamDefFeature.__table__.columns}
+        cache_feature_row(_def_feature_cache, key, feat_dict)
+        return feat_dict
 
-    past_games = db.query(TeamGameLog).filter(
-        TeamGameLog.team_id == team_id,
-        TeamGameLog.game_date < as_of_date
-    ).order_by(TeamGameLog.game_date.desc()).limit(window).all()
-    
-    if not past_games:
-        return None
+    return _compute_def_features_live(db, team_id, as_of_date, season, window)
 
-    return compute_defense_features(past_games, db, team_id, as_of_date, season, window)
+def get_def_features_bulk(db: Session, keys: list[tuple[int, date]], season: str, window: int = 10) -> dict:
+    """
+    Retrieves defensive features for many (team_id, as_of_date) pairs with a single feature-store query.
+    Pairs missing from the store are computed on-the-fly.
+    Returns {(team_id, as_of_date): feature dict or None}.
+    """
+    results = {}
+    missing = []
+    for team_id, as_of_date in set(keys):
+        cached = _def_feature_cache.get((team_id, as_of_date, window))
+        if cached is not None:
+            results[(team_id, as_of_date)] = cached
+        else:
+            missing.append((team_id, as_of_date))
+
+    if missing:
+        feats = db.execute(
+            select(TeamDefFeature).where(
+                tuple_(TeamDefFeature.team_id, TeamDefFeature.as_of_date).in_(missing),
+                TeamDefFeature.window == window
+            )
+        ).scalars().all()
+
+        for feat in feats:
+            feat_dict = {c.name: getattr(feat, c.name) for c in TeamDefFeature.__table__.columns}
+            cache_feature_row(_def_feature_cache, (feat.team_id, feat.as_of_date, window), feat_dict)
+            results[(feat.team_id, feat.as_of_date)] = feat_dict
+
+    for team_id, as_of_date in missing:
+        if (team_id, as_of_date) not in results:
+            results[(team_id, as_of_date)] = _compute_def_features_live(db, team_id, as_of_date, season, window)
 
+    return results
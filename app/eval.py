@@ -5,14 +5,32 @@ import joblib
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 from .models import Matchup
-from sklearn.linear_model import LogisticRegression
+from .ml import FEATURE_COLS, fuse_scaler, make_classifier
+from scipy.optimize import minimize
+from scipy.special import expit
 from sklearn.preprocessing import StandardScaler
-from sklearn.pipeline import Pipeline
-from sklearn.calibration import CalibratedClassifierCV
 from sklearn.metrics import accuracy_score, roc_auc_score, brier_score_loss
 
 logger = logging.getLogger(__name__)
 
+def fit_platt_sigmoid(logits: np.ndarray, y: np.ndarray) -> tuple[float, float]:
+    """
+    Fits Platt sigmoid calibration p = sigmoid(a * logit + b) on held-out logits.
+    Uses Platt's smoothed targets, matching sklearn's method='sigmoid'.
+    """
+    logits = logits.astype(np.float64)
+    n_pos = int(y.sum())
+    n_neg = len(y) - n_pos
+    t = np.where(y == 1, (n_pos + 1.0) / (n_pos + 2.0), 1.0 / (n_neg + 2.0))
+
+    def nll(params):
+        z = params[0] * logits + params[1]
+        grad = expit(z) - t
+        return (np.logaddexp(0.0, z) - t * z).sum(), np.array([grad @ logits, grad.sum()])
+
+    res = minimize(nll, x0=np.array([1.0, 0.0]), jac=True, method='L-BFGS-B')
+    return float(res.x[0]), float(res.x[1])
+
 def run_model_evaluation(db: Session, season: str, window: int = 10):
     """
     Runs walk-forward validation on matchups.
@@ -20,26 +38,24 @@ def run_model_evaluation(db: Session, season: str, window: int = 10):
     Includes probability calibration.
     """
     # 1. Load Data
-    query = select(Matchup).filter(Matchup.season == season).order_by(Matchup.game_date)
-    matchups = db.execute(query).scalars().all()
-    
-    if len(matchups) < 100:
-        return {"error": "Not enough matchups for robust evaluation"}
+    feature_cols = list(FEATURE_COLS)
 
-    feature_cols = [
-        col.name for col in Matchup.__table__.columns 
-        if col.name not in ['id', 'game_id', 'game_date', 'season', 'home_team_id', 'away_team_id', 'home_win']
-    ]
+    # Read only the needed columns straight into a DataFrame (no ORM hydration)
+    query = (
+        select(*[Matchup.__table__.c[col] for col in feature_cols], Matchup.home_win)
+        .filter(Matchup.season == season)
+        .order_by(Matchup.game_date)
+    )
+    df = pd.read_sql(query, db.bind)
     
-    data = []
-    for m in matchups:
-        row = {col: getattr(m, col) for col in feature_cols}
-        row['home_win'] = m.home_win
-        data.append(row)
+    if len(df) < 100:
+        return {"error": "Not enough matchups for robust evaluation"}
         
-    df = pd.DataFrame(data).dropna()
-    X = df[feature_cols]
-    y = df['home_win']
+    df = df.dropna()
+
+    # Materialize once as C-ordered arrays so each fold slice below is a zero-copy row view
+    X = np.ascontiguousarray(df[feature_cols].to_numpy(dtype=np.float32))
+    y = df['home_win'].to_numpy(dtype=np.int8)
 
     # 2. Walk-forward Validation (4 folds)
     # We'll use expanding window: 
@@ -50,38 +66,45 @@ def run_model_evaluation(db: Session, season: str, window: int = 10):
     
     n = len(df)
     fold_results = []
+
+    # Folds expand over the same ordered rows, so the scaler is carried across folds
+    # and only sees rows added since the previous fold. The model is the same estimator
+    # train_model ships (liblinear has no warm start, so each fold fits from scratch).
+    scaler = StandardScaler()
+    model = make_classifier()
+    scaled_rows = 0
     
     for i in range(4):
         train_end = int(n * (0.4 + i * 0.15))
         test_end = int(n * (0.55 + i * 0.15))
         
-        X_train, X_test = X.iloc[:train_end], X.iloc[train_end:test_end]
-        y_train, y_test = y.iloc[:train_end], y.iloc[train_end:test_end]
+        X_train, X_test = X[:train_end], X[train_end:test_end]
+        y_train, y_test = y[:train_end], y[train_end:test_end]
         
-        # Pipeline with Calibration
-        # We use sigmoid calibration. CalibratedClassifierCV with cv='prefit' 
-        # would require a separate val set, but here we can use it with a sub-split 
-        # within the training block to be time-safe, or just use 3-fold CV inside 
-        # which is usually fine for calibration if the window is large.
+        # Model with Calibration
+        # We use sigmoid (Platt) calibration, which requires a separate val set:
+        # we fit it on a sub-split within the training block to be time-safe.
         
         # To be strictly time-safe within the fold:
         # We'll split X_train again: 80% fit, 20% calibrate
         cal_split = int(len(X_train) * 0.8)
-        X_fit, X_cal = X_train.iloc[:cal_split], X_train.iloc[cal_split:]
-        y_fit, y_cal = y_train.iloc[:cal_split], y_train.iloc[cal_split:]
-        
-        base_pipeline = Pipeline([
-            ('scaler', StandardScaler()),
-            ('model', LogisticRegression(random_state=42))
-        ])
+        X_fit, X_cal = X_train[:cal_split], X_train[cal_split:]
+        y_fit, y_cal = y_train[:cal_split], y_train[cal_split:]
         
-        base_pipeline.fit(X_fit, y_fit)
-        
-        calibrated = CalibratedClassifierCV(base_pipeline, cv='prefit', method='sigmoid')
-        calibrated.fit(X_cal, y_cal)
+        if cal_split > scaled_rows:
+            scaler.partial_fit(X_fit[scaled_rows:])
+            scaled_rows = cal_split
+        model.fit(scaler.transform(X_fit), y_fit)
+
+        # Calibration and test logits come from the fused weights, skipping the scaled
+        # copies and input validation of transform + decision_function
+        fused = fuse_scaler(scaler, model)
+
+        # Sigmoid calibration is a 2-parameter fit on the model's calibration-slice logits
+        a, b = fit_platt_sigmoid(X_cal @ fused['w'] + fused['b'], y_cal)
         
         # Evaluate on Test
-        y_proba = calibrated.predict_proba(X_test)[:, 1]
+        y_proba = expit(a * (X_test @ fused['w'] + fused['b']) + b)
         y_pred = (y_proba > 0.5).astype(int)
         
         fold_metrics = {
@@ -1,69 +1,112 @@
 import logging
+import threading
+from bisect import bisect_left
 from datetime import date
 from sqlalchemy.orm import Session
-from sqlalchemy import select, and_, exists
+from sqlalchemy import select, and_, exists, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from .models import TeamGameLog, TeamFeature
 import pandas as pd
+import numpy as np
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def compute_features(games: list[TeamGameLog], team_id: int, as_of_date: date, season: str, window: int) -> dict:
+# In-process cache of feature-store rows keyed by (team_id, as_of_date, window).
+# Stored rows are never updated (inserts skip conflicts), so entries cannot go stale.
+FEATURE_CACHE_SIZE = 4096
+_feature_cache: dict[tuple[int, date, int], dict] = {}
+# Serializes evict-and-insert across request threads (reads stay lock-free)
+_FEATURE_CACHE_LOCK = threading.Lock()
+
+# Box-score columns averaged over the rolling window, in kernel column order
+STAT_COLS = ['pts', 'fga', 'fg3a', 'fta', 'oreb', 'tov']
+
+def team_bounds(team_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
     """
-    Computes rolling features from a list of TeamGameLog objects.
-    Returns a dictionary matching TeamFeature columns or None if empty.
+    Returns start/end offsets of each contiguous team block in a team-sorted array.
     """
-    if not games:
-        return None
+    if len(team_ids) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    starts = np.flatnonzero(np.r_[True, team_ids[1:] != team_ids[:-1]])
+    ends = np.r_[starts[1:], len(team_ids)]
+    return starts, ends
 
-    # Convert to DataFrame for easier calc
-    # Extract only needed columns to speed up
-    data = []
-    for g in games:
-        data.append({
-            'pts': g.pts,
-            'fga': g.fga,
-            'fg3a': g.fg3a,
-            'fta': g.fta,
-            'oreb': g.oreb,
-            'tov': g.tov
-        })
-    
-    df = pd.DataFrame(data)
-    
-    # Calculate Averages
-    avg_pts = df['pts'].mean()
-    avg_fga = df['fga'].mean()
-    avg_fg3a = df['fg3a'].mean()
-    avg_fta = df['fta'].mean()
-    avg_oreb = df['oreb'].mean()
-    avg_tov = df['tov'].mean()
+def rolling_window_sums(stats: np.ndarray, team_starts: np.ndarray, team_ends: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Rolling-window kernel over a (N, k) stats array sorted by team, then date.
+    Row i of the result covers the `window` rows before i of the same team (row i excluded).
+    Returns (sums, counts), both NaN-aware: NaN cells add nothing and are not counted.
+    Each window is the difference of two running totals, so cost is O(N) regardless of `window`.
+    """
+    valid = ~np.isnan(stats)
+    vals = np.where(valid, stats, 0.0)
+
+    # Running totals with a leading zero row: csum[j] is the sum of rows [0, j)
+    csum = np.zeros((len(vals) + 1, vals.shape[1]))
+    np.cumsum(vals, axis=0, out=csum[1:])
+    ccount = np.zeros_like(csum)
+    np.cumsum(valid, axis=0, out=ccount[1:])
+
+    # Window for row i is [max(team start, i - window), i)
+    idx = np.arange(len(vals))
+    lo = np.maximum(np.repeat(team_starts, team_ends - team_starts), idx - window)
+
+    return csum[idx] - csum[lo], ccount[idx] - ccount[lo]
+
+def derive_feature_columns(means: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Builds the TeamFeature value columns (including derived rates) from a (M, 6) array
+    of averaged STAT_COLS. Zero-denominator guards use np.where, so there are no per-row branches.
+    """
+    avg_pts, avg_fga, avg_fg3a, avg_fta, avg_oreb, avg_tov = means.T
 
     # Derived Features
     # avg_poss = avg_fga - avg_oreb + avg_tov + 0.44 * avg_fta
     avg_poss = avg_fga - avg_oreb + avg_tov + (0.44 * avg_fta)
 
     # Avoid division by zero
-    rate_3pa = avg_fg3a / avg_fga if avg_fga > 0 else 0.0
-    rate_fta = avg_fta / avg_fga if avg_fga > 0 else 0.0
-    rate_tov = avg_tov / avg_poss if avg_poss > 0 else 0.0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rate_3pa = np.where(avg_fga > 0, avg_fg3a / avg_fga, 0.0)
+        rate_fta = np.where(avg_fga > 0, avg_fta / avg_fga, 0.0)
+        rate_tov = np.where(avg_poss > 0, avg_tov / avg_poss, 0.0)
+
+    return {
+        "avg_pts": avg_pts,
+        "avg_fga": avg_fga,
+        "avg_fg3a": avg_fg3a,
+        "avg_fta": avg_fta,
+        "avg_oreb": avg_oreb,
+        "avg_tov": avg_tov,
+        "avg_poss": avg_poss,
+        "rate_3pa": rate_3pa,
+        "rate_fta": rate_fta,
+        "rate_tov": rate_tov
+    }
+
+def compute_features(games: list[TeamGameLog], team_id: int, as_of_date: date, season: str, window: int) -> dict:
+    """
+    Computes rolling features from a list of TeamGameLog objects.
+    Returns a dictionary matching TeamFeature columns or None if empty.
+    """
+    if not games:
+        return None
+
+    # Stack the needed columns into one array and reduce in a single pass
+    stats = np.empty((len(games), 6), dtype=np.float64)
+    for i, g in enumerate(games):
+        stats[i] = (g.pts, g.fga, g.fg3a, g.fta, g.oreb, g.tov)
+    
+    # Calculate Averages (NaN-aware, matching pandas' skipna)
+    means = np.nanmean(stats, axis=0)
+    columns = derive_feature_columns(means.reshape(1, -1))
 
     return {
         "team_id": team_id,
         "as_of_date": as_of_date,
         "season": season,
         "window": window,
-        "games_used": len(df),
-        "avg_pts": float(avg_pts),
-        "avg_fga": float(avg_fga),
-        "avg_fg3a": float(avg_fg3a),
-        "avg_fta": float(avg_fta),
-        "avg_oreb": float(avg_oreb),
-        "avg_tov": float(avg_tov),
-        "avg_poss": float(avg_poss),
-        "rate_3pa": float(rate_3pa),
-        "rate_fta": float(rate_fta),
-        "rate_tov": float(rate_tov)
+        "games_used": len(games),
+        **{name: float(col[0]) for name, col in columns.items()}
     }
 
 def build_team_features_for_season(db: Session, season: str, window: int = 10, min_games: int = 5) -> dict:
@@ -93,59 +136,68 @@ def build_team_features_for_season(db: Session, season: str, window: int = 10, m
     inserted_count = 0
     skipped_count = 0
     
-    # Pre-fetch existing features signatures to skip efficiently
-    existing_sigs = set(
-        db.execute(
-            select(TeamFeature.team_id, TeamFeature.as_of_date)
-            .filter(TeamFeature.window == window)
-            # .filter(TeamFeature.season == season) # good if we had season column populated correctly
-        ).all()
+    # Pre-fetch all logs once, sorted per team, and compute every rolling window in one pass
+    logs_df = pd.read_sql(
+        select(TeamGameLog).order_by(TeamGameLog.team_id, TeamGameLog.game_date),
+        db.bind
+    )
+    team_ids = logs_df['team_id'].to_numpy()
+    team_starts, team_ends = team_bounds(team_ids)
+    sums, counts = rolling_window_sums(
+        logs_df[STAT_COLS].to_numpy(dtype=np.float64), team_starts, team_ends, window
     )
+    with np.errstate(invalid='ignore', divide='ignore'):
+        window_means = sums / counts
 
-    batch_buffer = []
-    BATCH_SIZE = 200
+    game_dates = logs_df['game_date'].tolist()
+    team_blocks = {
+        int(team_ids[start]): (start, game_dates[start:end])
+        for start, end in zip(team_starts, team_ends)
+    }
 
-    for team_id, game_date in targets:
-        if (team_id, game_date) in existing_sigs:
-            skipped_count += 1
-            continue
+    # Idempotency is enforced by the (team_id, as_of_date, window) unique constraint:
+    # conflicting rows are dropped by Postgres and RETURNING tells us what was inserted
+    insert_stmt = (
+        pg_insert(TeamFeature.__table__)
+        .on_conflict_do_nothing(index_elements=['team_id', 'as_of_date', 'window'])
+        .returning(TeamFeature.__table__.c.id)
+    )
 
-        # Get previous games
+    BATCH_SIZE = 10_000 # Plain dict rows via Core executemany; large batches amortize round-trips
+
+    target_rows = []
+    target_keys = []
+    for team_id, game_date in targets:
+        # Position of the team's first log on game_date; its window covers strictly earlier games
         # game_date is NOT datetime, it's date.
-        past_games = db.query(TeamGameLog).filter(
-            TeamGameLog.team_id == team_id,
-            TeamGameLog.game_date < game_date
-        ).order_by(TeamGameLog.game_date.desc()).limit(window).all()
+        start, dates = team_blocks[team_id]
+        end = bisect_left(dates, game_date)
+        games_used = min(end, window)
 
-        if len(past_games) < min_games:
+        if games_used < min_games:
             skipped_count += 1 # Not enough history
             continue
 
-        feat_dict = compute_features(past_games, team_id, game_date, season, window)
-        if feat_dict:
-            feature_obj = TeamFeature(**feat_dict)
-            batch_buffer.append(feature_obj)
-
-        if len(batch_buffer) >= BATCH_SIZE:
-            try:
-                db.bulk_save_objects(batch_buffer)
-                db.commit()
-                inserted_count += len(batch_buffer)
-                batch_buffer = []
-            except Exception as e:
-                db.rollback()
-                logger.error(f"Batch insert error: {e}")
-                raise e
-
-    # Commit remaining
-    if batch_buffer:
+        target_rows.append(start + end)
+        target_keys.append((team_id, game_date, games_used))
+
+    # Derive every target's feature columns in one vectorized pass
+    out_df = pd.DataFrame(target_keys, columns=['team_id', 'as_of_date', 'games_used'])
+    out_df.insert(2, 'season', season)
+    out_df.insert(3, 'window', window)
+    for name, col in derive_feature_columns(window_means[target_rows]).items():
+        out_df[name] = col
+
+    for batch_start in range(0, len(out_df), BATCH_SIZE):
+        batch_buffer = out_df.iloc[batch_start:batch_start + BATCH_SIZE].to_dict('records')
         try:
-            db.bulk_save_objects(batch_buffer)
+            inserted = len(db.execute(insert_stmt, batch_buffer).all())
             db.commit()
-            inserted_count += len(batch_buffer)
+            inserted_count += inserted
+            skipped_count += len(batch_buffer) - inserted # Already present
         except Exception as e:
             db.rollback()
-            logger.error(f"Final batch insert error: {e}")
+            logger.error(f"Batch insert error: {e}")
             raise e
 
     return {
@@ -156,11 +208,39 @@ def build_team_features_for_season(db: Session, season: str, window: int = 10, m
         "total_candidates": total_candidates
     }
 
+def cache_feature_row(cache: dict, key: tuple, feat_dict: dict):
+    """
+    Stores a feature-store row in an in-process cache, evicting the oldest entry when full.
+    """
+    with _FEATURE_CACHE_LOCK:
+        if key not in cache and len(cache) >= FEATURE_CACHE_SIZE:
+            cache.pop(next(iter(cache)))
+        cache[key] = feat_dict
+
+def _compute_team_features_live(db: Session, team_id: int, as_of_date: date, season: str, window: int) -> dict:
+    """
+    Computes features on-the-fly from the team's last `window` games before as_of_date.
+    """
+    past_games = db.query(TeamGameLog).filter(
+        TeamGameLog.team_id == team_id,
+        TeamGameLog.game_date < as_of_date
+    ).order_by(TeamGameLog.game_date.desc()).limit(window).all()
+    
+    if not past_games:
+        return None
+
+    return compute_features(past_games, team_id, as_of_date, season, window)
+
 def get_or_compute_team_features(db: Session, team_id: int, as_of_date: date, season: str, window: int = 10) -> dict:
     """
-    Retrieves features from DB or computes them on-the-fly.
+    Retrieves features from the cache, then DB, or computes them on-the-fly.
     """
-    # Try DB first
+    key = (team_id, as_of_date, window)
+    cached = _feature_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # Try DB next
     feat = db.scalar(
         select(TeamFeature).where(
             TeamFeature.team_id == team_id,
@@ -171,15 +251,43 @@ def get_or_compute_team_features(db: Session, team_id: int, as_of_date: date, se
     
     if feat:
         # Convert object to dict
-        return {c.name: getattr(feat, c.name) for c in TeamFeature.__table__.columns}
+        feat_dict = {c.name: getattr(feat, c.name) for c in TeamFeature.__table__.columns}
+        cache_feature_row(_feature_cache, key, feat_dict)
+        return feat_dict
 
     # Compute on-the-fly
-    past_games = db.query(TeamGameLog).filter(
-        TeamGameLog.team_id == team_id,
-        TeamGameLog.game_date < as_of_date
-    ).order_by(TeamGameLog.game_date.desc()).limit(window).all()
-    
-    if not past_games:
-        return None
+    return _compute_team_features_live(db, team_id, as_of_date, season, window)
 
-    return compute_features(past_games, team_id, as_of_date, season, window)
+def get_team_features_bulk(db: Session, keys: list[tuple[int, date]], season: str, window: int = 10) -> dict:
+    """
+    Retrieves features for many (team_id, as_of_date) pairs with a single feature-store query.
+    Pairs missing from the store are computed on-the-fly.
+    Returns {(team_id, as_of_date): feature dict or None}.
+    """
+    results = {}
+    missing = []
+    for team_id, as_of_date in set(keys):
+        cached = _feature_cache.get((team_id, as_of_date, window))
+        if cached is not None:
+            results[(team_id, as_of_date)] = cached
+        else:
+            missing.append((team_id, as_of_date))
+
+    if missing:
+        feats = db.execute(
+            select(TeamFeature).where(
+                tuple_(TeamFeature.team_id, TeamFeature.as_of_date).in_(missing),
+                TeamFeature.window == window
+            )
+        ).scalars().all()
+
+        for feat in feats:
+            feat_dict = {c.name: getattr(feat, c.name) for c in TeamFeature.__table__.columns}
+            cache_feature_row(_feature_cache, (feat.team_id, feat.as_of_date, window), feat_dict)
+            results[(feat.team_id, feat.as_of_date)] = feat_dict
+
+    for team_id, as_of_date in missing:
+        if (team_id, as_of_date) not in results:
+            results[(team_id, as_of_date)] = _compute_team_features_live(db, team_id, as_of_date, season, window)
+
+    return results
@@ -2,19 +2,33 @@ import logging
 from datetime import date
 from sqlalchemy.orm import Session
 from sqlalchemy import select, func
-from .models import TeamFeature, TeamDefFeature, SeasonFeatureBaseline, Matchup
-from .features import get_or_compute_team_features
-from .defense_features import get_or_compute_def_features
-from .ml import predict_win_probability, MODEL_PATH
-from .baselines import get_baselines_dict
-import pandas as pd
+from .models import TeamFeature, TeamDefFeature, SeasonFeatureBaseline
+from .features import get_team_features_bulk
+from .defense_features import get_def_features_bulk
+from .ml import score_matchup, MODEL_PATH
+from .baselines import get_baseline_arrays, baseline_arrays
 import numpy as np
-import joblib
 import os
+import heapq
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def _top_contributions(contribs, features, k=3):
+    """
+    Returns the k largest contributions by absolute value as {feature, contribution} dicts.
+    """
+    # Stable sort of ~20 magnitudes: ties keep column order, like sorted(..., reverse=True)
+    top = np.argsort(-np.abs(contribs), kind='stable')[:k]
+    return [{"feature": features[i], "contribution": float(contribs[i])} for i in top]
+
+def _infer(home_features, away_features):
+    """
+    Win probability and top contributions for the home team from a single input vector.
+    Returns (prob, top_factors).
+    """
+    prob, contribs, features = score_matchup(home_features, away_features)
+    return prob, _top_contributions(contribs, features)
+
 def get_feature_contributions(home_features, away_features):
     """
     Computes top feature contributions for Team A (Home) win probability.
@@ -23,71 +37,56 @@ def get_feature_contributions(home_features, away_features):
     if not os.path.exists(MODEL_PATH):
         return []
 
-    pipeline = joblib.load(MODEL_PATH)
-    model = pipeline.named_steps['model']
-    scaler = pipeline.named_steps['scaler']
-    
-    # Reconstruct input vector (Home then Away)
-    feature_cols = [
-        col.name for col in Matchup.__table__.columns 
-        if col.name not in ['id', 'game_id', 'game_date', 'season', 'home_team_id', 'away_team_id', 'home_win']
-    ]
-    
-    input_data = {}
-    for k, v in home_features.items():
-        if f"home_{k}" in feature_cols: input_data[f"home_{k}"] = v
-    for k, v in away_features.items():
-        if f"away_{k}" in feature_cols: input_data[f"away_{k}"] = v
-        
-    df = pd.DataFrame([input_data])
-    for col in feature_cols:
-        if col not in df.columns: df[col] = 0.0
-    df = df[feature_cols]
-    
-    # Standardize
-    X_scaled = scaler.transform(df)[0]
-    
     # Contribution = scaled_value * coefficient
     # For LogReg, positive contribution means increases prob of Class 1 (Home Win)
-    coeffs = model.coef_[0]
-    contributions = []
-    for i, col in enumerate(feature_cols):
-        contributions.append({
-            "feature": col,
-            "contribution": float(X_scaled[i] * coeffs[i])
-        })
-        
-    # Sort by absolute contribution
-    contributions = sorted(contributions, key=lambda x: abs(x['contribution']), reverse=True)
-    return contributions[:3]
-
-def generate_team_tips(team_off, team_def, opp_off, opp_def, baselines):
+    _, contribs, features = score_matchup(home_features, away_features)
+    return _top_contributions(contribs, features)
+
+# Inputs z-scored for the tip rules, as (source, feature) with source in team_off / opp_off / opp_def.
+# Column order here is the column order of the z matrix consumed by _tips_from_z.
+TIP_Z_FEATURES = [
+    ('opp_def', 'def_rate_3pa_allowed'),
+    ('team_off', 'rate_3pa'),
+    ('opp_def', 'def_rate_fta_allowed'),
+    ('team_off', 'rate_fta'),
+    ('opp_def', 'def_avg_pts_allowed'),
+    ('team_off', 'rate_tov'),
+    ('opp_def', 'def_rate_tov_forced'),
+    ('team_off', 'avg_poss'),
+    ('opp_off', 'avg_poss'),
+    ('opp_off', 'rate_3pa'),
+    ('opp_off', 'rate_fta'),
+    ('team_off', 'avg_oreb'),
+]
+
+def _add_tip(tips, condition_met, score, theme, text, evidence):
     """
-    Generates and ranks tips for a single team using z-scores and rarity.
+    Appends a tip to tips if its rule fired and it scores above the 0.3 floor.
     """
+    if not (condition_met and score > 0.3):
+        return
+    tips.append({
+        "theme": theme,
+        "text": text,
+        "score": round(float(score), 2),
+        "evidence": evidence
+    })
+
+def _tips_from_z(z, opp_def):
+    """
+    Applies the tip rules to one row of precomputed z-scores (TIP_Z_FEATURES order).
+    Returns the top 5 tips, padded with generic tips up to at least 3.
+    """
+    (opp_3p_allowed_z, team_3p_z, opp_fta_allowed_z, team_fta_z, opp_pts_allowed_z,
+     team_tov_z, opp_forced_tov_z, team_poss_z, opp_poss_z, opp_3pa_z, opp_fta_z, team_oreb_z) = z
+
     candidate_tips = []
-    
-    def add_tip(condition_met, score, theme, text, evidence):
-        if condition_met and score > 0.3:
-            candidate_tips.append({
-                "theme": theme,
-                "text": text,
-                "score": round(float(score), 2),
-                "evidence": evidence
-            })
-
-    # Helper for z-score
-    def get_z(val, feat):
-        b = baselines.get(feat)
-        if not b or b['std'] == 0: return 0
-        return (val - b['mean']) / b['std']
 
     # 1. Opponent 3P Weakness vs Team 3P Tendency
-    opp_3p_allowed_z = get_z(opp_def['def_rate_3pa_allowed'], 'def_rate_3pa_allowed')
-    team_3p_z = get_z(team_off['rate_3pa'], 'rate_3pa')
     # Tip score is high if opponent allows more than average AND team shoots more than average
     score_3p = (opp_3p_allowed_z + team_3p_z) / 2
-    add_tip(
+    _add_tip(
+        candidate_tips,
         opp_3p_allowed_z > 0.3,
         score_3p,
         "OFFENSE",
@@ -96,10 +95,9 @@ def generate_team_tips(team_off, team_def, opp_off, opp_def, baselines):
     )
 
     # 2. Attack the Rim (FTA)
-    opp_fta_allowed_z = get_z(opp_def['def_rate_fta_allowed'], 'def_rate_fta_allowed')
-    team_fta_z = get_z(team_off['rate_fta'], 'rate_fta')
     score_fta = (opp_fta_allowed_z + team_fta_z) / 2
-    add_tip(
+    _add_tip(
+        candidate_tips,
         opp_fta_allowed_z > 0.3,
         score_fta,
         "OFFENSE",
@@ -108,8 +106,8 @@ def generate_team_tips(team_off, team_def, opp_off, opp_def, baselines):
     )
 
     # 3. Overall Defensive Vulnerability
-    opp_pts_allowed_z = get_z(opp_def['def_avg_pts_allowed'], 'def_avg_pts_allowed')
-    add_tip(
+    _add_tip(
+        candidate_tips,
         opp_pts_allowed_z > 0.5,
         opp_pts_allowed_z,
         "PACE",
@@ -118,10 +116,9 @@ def generate_team_tips(team_off, team_def, opp_off, opp_def, baselines):
     )
 
     # 4. Ball Security
-    team_tov_z = get_z(team_off['rate_tov'], 'rate_tov')
-    opp_forced_tov_z = get_z(opp_def['def_rate_tov_forced'], 'def_rate_tov_forced')
     score_tov = (team_tov_z + opp_forced_tov_z) / 2
-    add_tip(
+    _add_tip(
+        candidate_tips,
         team_tov_z > 0.3 and opp_forced_tov_z > 0.3,
         score_tov,
         "BALL CONTROL",
@@ -130,17 +127,15 @@ def generate_team_tips(team_off, team_def, opp_off, opp_def, baselines):
     )
 
     # 5. Pace Control
-    team_poss_z = get_z(team_off['avg_poss'], 'avg_poss')
-    opp_poss_z = get_z(opp_off['avg_poss'], 'avg_poss')
     pace_diff_z = team_poss_z - opp_poss_z
     if pace_diff_z > 0.5:
-        add_tip(True, pace_diff_z, "TEMPO", "Push pace and play faster than the opponent prefers.", f"Team pace is +{pace_diff_z:.1f} std dev vs opponent.")
+        _add_tip(candidate_tips, True, pace_diff_z, "TEMPO", "Push pace and play faster than the opponent prefers.", f"Team pace is +{pace_diff_z:.1f} std dev vs opponent.")
     elif pace_diff_z < -0.5:
-        add_tip(True, abs(pace_diff_z), "TEMPO", "Control tempo and limit transition opportunities.", f"Team prefers slower pace (-{abs(pace_diff_z):.1f} std dev).")
+        _add_tip(candidate_tips, True, abs(pace_diff_z), "TEMPO", "Control tempo and limit transition opportunities.", f"Team prefers slower pace (-{abs(pace_diff_z):.1f} std dev).")
 
     # 6. Defensive Priority (Shooters)
-    opp_3pa_z = get_z(opp_off['rate_3pa'], 'rate_3pa')
-    add_tip(
+    _add_tip(
+        candidate_tips,
         opp_3pa_z > 0.5,
         opp_3pa_z,
         "DEFENSE",
@@ -149,8 +144,8 @@ def generate_team_tips(team_off, team_def, opp_off, opp_def, baselines):
     )
 
     # 7. Defend without Fouling
-    opp_fta_z = get_z(opp_off['rate_fta'], 'rate_fta')
-    add_tip(
+    _add_tip(
+        candidate_tips,
         opp_fta_z > 0.5,
         opp_fta_z,
         "DEFENSE",
@@ -159,8 +154,8 @@ def generate_team_tips(team_off, team_def, opp_off, opp_def, baselines):
     )
 
     # 8. Offensive Rebounding
-    team_oreb_z = get_z(team_off['avg_oreb'], 'avg_oreb')
-    add_tip(
+    _add_tip(
+        candidate_tips,
         team_oreb_z > 0.5,
         team_oreb_z,
         "EFFICIENCY",
@@ -179,38 +174,68 @@ def generate_team_tips(team_off, team_def, opp_off, opp_def, baselines):
         if len(candidate_tips) < 3:
             candidate_tips.append(gt)
 
-    # Sort and return
-    return sorted(candidate_tips, key=lambda x: x['score'], reverse=True)[:5]
+    # Top 5 by score (same order as a stable descending sort)
+    return heapq.nlargest(5, candidate_tips, key=lambda x: x['score'])
+
+def generate_tips_batch(team_offs, opp_offs, opp_defs, baselines):
+    """
+    Generates ranked tips for many matchups at once (e.g. a full slate).
+    Row i describes team_offs[i] playing against opp_offs[i] / opp_defs[i].
+    baselines is the aligned (feature_idx, means, stds) form from get_baseline_arrays.
+    All z-scores are computed as one (M, K) array operation.
+    """
+    sources = {'team_off': team_offs, 'opp_off': opp_offs, 'opp_def': opp_defs}
+    vals = np.array(
+        [[sources[source][i][feat] for source, feat in TIP_Z_FEATURES] for i in range(len(team_offs))],
+        dtype=np.float64
+    ).reshape(len(team_offs), len(TIP_Z_FEATURES))
+
+    # Missing baselines and zero std both yield z = 0
+    feature_idx, all_means, all_stds = baselines
+    pos = np.array([feature_idx.get(feat, -1) for _, feat in TIP_Z_FEATURES])
+    found = pos >= 0
+    means = np.zeros(len(TIP_Z_FEATURES))
+    stds = np.zeros(len(TIP_Z_FEATURES))
+    means[found] = all_means[pos[found]]
+    stds[found] = all_stds[pos[found]]
+
+    safe_stds = np.where(stds == 0, 1.0, stds)
+    z = np.where(stds == 0, 0.0, (vals - means) / safe_stds)
+
+    return [_tips_from_z(z[i], opp_defs[i]) for i in range(len(team_offs))]
+
+def generate_team_tips(team_off, team_def, opp_off, opp_def, baselines):
+    """
+    Generates and ranks tips for a single team using z-scores and rarity.
+    """
+    return generate_tips_batch([team_off], [opp_off], [opp_def], baseline_arrays(baselines))[0]
 
 def generate_gameplan(db: Session, team_a_id: int, team_b_id: int, season: str, as_of_date: date, window: int):
     """
     Generates a full gameplan for both teams with explainability.
     """
-    # 1. Load Features
-    a_off = get_or_compute_team_features(db, team_a_id, as_of_date, season, window)
-    a_def = get_or_compute_def_features(db, team_a_id, as_of_date, season, window)
-    b_off = get_or_compute_team_features(db, team_b_id, as_of_date, season, window)
-    b_def = get_or_compute_def_features(db, team_b_id, as_of_date, season, window)
+    # 1. Load Features (one store query per feature family for both teams)
+    keys = [(team_a_id, as_of_date), (team_b_id, as_of_date)]
+    offs = get_team_features_bulk(db, keys, season, window)
+    defs = get_def_features_bulk(db, keys, season, window)
+    a_off, b_off = offs[keys[0]], offs[keys[1]]
+    a_def, b_def = defs[keys[0]], defs[keys[1]]
 
     if not all([a_off, a_def, b_off, b_def]):
         return None
 
-    # 2. Get Win Probability
-    win_prob_a = predict_win_probability(a_off, b_off)
+    # 2. Get Win Probability and 3. Explainability (one scaled vector feeds both)
+    win_prob_a, factors = _infer(a_off, b_off)
     win_prob_b = 1.0 - win_prob_a
 
-    # 3. Get Explainability
-    factors = get_feature_contributions(a_off, b_off)
-
     # 4. Get Baselines
-    baselines = get_baselines_dict(db, season, window)
-    if not baselines:
+    baselines = get_baseline_arrays(db, season, window)
+    if not baselines[0]:
         logger.warning("No baselines found. Run compute-baselines first.")
         return None
 
     # 5. Generate Tips
-    tips_a = generate_team_tips(a_off, a_def, b_off, b_def, baselines)
-    tips_b = generate_team_tips(b_off, b_def, a_off, a_def, baselines)
+    tips_a, tips_b = generate_tips_batch([a_off, b_off], [b_off, a_off], [b_def, a_def], baselines)
 
     return {
         "team_a": {
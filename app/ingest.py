@@ -1,22 +1,45 @@
 import logging
 import argparse
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import select, insert
 from nba_api.stats.endpoints import leaguegamelog
-from datetime import datetime
+import pandas as pd
 from .models import TeamGameLog
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# TeamGameLog column -> LeagueGameLog column, for everything besides the key columns
+LOG_COLUMNS = {
+    'matchup': 'MATCHUP',
+    'wl': 'WL',
+    'pts': 'PTS',
+    'fgm': 'FGM',
+    'fga': 'FGA',
+    'fg_pct': 'FG_PCT',
+    'fg3m': 'FG3M',
+    'fg3a': 'FG3A',
+    'fg3_pct': 'FG3_PCT',
+    'ftm': 'FTM',
+    'fta': 'FTA',
+    'ft_pct': 'FT_PCT',
+    'oreb': 'OREB',
+    'dreb': 'DREB',
+    'reb': 'REB',
+    'ast': 'AST',
+    'stl': 'STL',
+    'blk': 'BLK',
+    'tov': 'TOV',
+    'pf': 'PF',
+    'plus_minus': 'PLUS_MINUS'
+}
+
 def fetch_and_ingest_game_logs(db: Session, season: str = '2023-24') -> dict:
     """
     Fetches game logs for a specific season and ingests them into the database.
     Skips duplicates based on (game_id, team_id).
     Returns a dictionary with execution stats.
     """
-    logger.info(f"Starting ingestion for season: {season}")
+    logger.info("Starting ingestion for season: %s", season)
     
     try:
         # Fetch data from NBA API
@@ -24,87 +47,61 @@ def fetch_and_ingest_game_logs(db: Session, season: str = '2023-24') -> dict:
         log = leaguegamelog.LeagueGameLog(season=season, player_or_team_abbreviation='T')
         df = log.get_data_frames()[0]
         rows_fetched = len(df)
-        logger.info(f"Fetched {rows_fetched} rows from API.")
+        logger.info("Fetched %d rows from API.", rows_fetched)
     except Exception as e:
-        logger.error(f"Failed to fetch data from NBA API: {e}")
+        logger.error("Failed to fetch data from NBA API: %s", e)
         raise e
 
     # Optimization: Pre-fetch existing IDs to avoid N+1 selects
     logger.info("Checking for existing records...")
-    existing_keys = set(
+    # Stream rows straight into plain (game_id, team_id) tuples; no intermediate list of Row objects
+    existing_keys = set(map(tuple,
         db.execute(
             select(TeamGameLog.game_id, TeamGameLog.team_id)
-        ).all()
-    )
-    logger.info(f"Found {len(existing_keys)} existing records in DB.")
+        )
+    ))
+    logger.info("Found %d existing records in DB.", len(existing_keys))
 
-    new_objects = []
+    new_rows = []
     skipped_count = 0
 
-    for _, row in df.iterrows():
-        try:
-            game_id = str(row['GAME_ID'])
-            team_id = int(row['TEAM_ID'])
+    # Convert the key columns once, column-wise (no per-row Series / strptime)
+    game_ids = df['GAME_ID'].astype(str).tolist()
+    team_ids = df['TEAM_ID'].astype(int).tolist()
+    game_dates = pd.to_datetime(df['GAME_DATE'], format='%Y-%m-%d', errors='coerce').dt.date.tolist()
+    stat_rows = df[list(LOG_COLUMNS.values())].itertuples(index=False, name=None)
 
-            if (game_id, team_id) in existing_keys:
-                skipped_count += 1
-                continue
+    for game_id, team_id, game_date_obj, values in zip(game_ids, team_ids, game_dates, stat_rows):
+        if (game_id, team_id) in existing_keys:
+            skipped_count += 1
+            continue
 
-            # Parse date
-            game_date_obj = datetime.strptime(row['GAME_DATE'], '%Y-%m-%d').date()
-            
-            game_log = TeamGameLog(
-                game_id=game_id,
-                team_id=team_id,
-                game_date=game_date_obj,
-                matchup=row['MATCHUP'],
-                wl=row['WL'],
-                pts=row['PTS'],
-                fgm=row['FGM'],
-                fga=row['FGA'],
-                fg_pct=row['FG_PCT'],
-                fg3m=row['FG3M'],
-                fg3a=row['FG3A'],
-                fg3_pct=row['FG3_PCT'],
-                ftm=row['FTM'],
-                fta=row['FTA'],
-                ft_pct=row['FT_PCT'],
-                oreb=row['OREB'],
-                dreb=row['DREB'],
-                reb=row['REB'],
-                ast=row['AST'],
-                stl=row['STL'],
-                blk=row['BLK'],
-                tov=row['TOV'],
-                pf=row['PF'],
-                plus_minus=row['PLUS_MINUS']
-            )
-            new_objects.append(game_log)
-        except Exception as e:
-            logger.error(f"Error preparing row {row.get('GAME_ID')}: {e}")
+        if pd.isna(game_date_obj):
+            logger.error("Error preparing row %s: unparseable GAME_DATE", game_id)
             continue
 
-    if new_objects:
+        new_rows.append({
+            'game_id': game_id,
+            'team_id': team_id,
+            'game_date': game_date_obj,
+            **dict(zip(LOG_COLUMNS, values))
+        })
+
+    if new_rows:
         try:
-            logger.info(f"Inserting {len(new_objects)} new records...")
-            db.bulk_save_objects(new_objects)
+            logger.info("Inserting %d new records...", len(new_rows))
+            # Plain dicts through Core executemany: no ORM instances to construct
+            db.execute(insert(TeamGameLog), new_rows)
             db.commit()
-            inserted_count = len(new_objects)
+            inserted_count = len(new_rows)
         except Exception as e:
             db.rollback()
-            logger.error(f"Error committing batch: {e}")
+            logger.error("Error committing batch: %s", e)
             raise e
     else:
         inserted_count = 0
 
-    logger.info(f"Ingestion complete. Fetched: {rows_fetched}, Inserted: {inserted_count}, Skipped: {skipped_count}")
-
-    return {
-        "season": season,
-        "rows_fetched": rows_fetched,
-        "inserted": inserted_count,
-        "skipped": skipped_count
-    }
+    logger.info("Ingestion complete. Fetched: %d, Inserted: %d, Skipped: %d", rows_fetched, inserted_count, skipped_count)
 
     return {
         "season": season,
@@ -115,6 +112,8 @@ def fetch_and_ingest_game_logs(db: Session, season: str = '2023-24') -> dict:
 
 if __name__ == "__main__":
     from .db import SessionLocal
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     
     parser = argparse.ArgumentParser(description="Ingest NBA Game Logs")
     parser.add_argument("--season", type=str, default="2023-24", help="Season to ingest (e.g., 2023-24)")
@@ -1,6 +1,4 @@
 from .db import engine, Base
-from .db import engine, Base
-from .db import engine, Base
 from .models import TeamGameLog, TeamFeature, Matchup, TeamDefFeature
 
 def init_db():
@@ -8,5 +6,12 @@ def init_db():
     Base.metadata.create_all(bind=engine)
     print("Tables created successfully.")
 
+    # create_all skips tables that already exist, so add any indexes declared since
+    # (CREATE INDEX only when missing)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    print("Indexes verified.")
+
 if __name__ == "__main__":
     init_db()
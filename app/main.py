@@ -1,8 +1,9 @@
+import logging
 from fastapi import FastAPI, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from .db import get_db, engine, Base
 from .ingest import fetch_and_ingest_game_logs
-from .features import build_team_features_for_season, get_or_compute_team_features
+from .features import build_team_features_for_season, get_or_compute_team_features, get_team_features_bulk
 from .defense_features import build_defense_features_for_season
 from .gameplan import generate_gameplan
 from .matchups import build_matchups_for_season
@@ -13,6 +14,9 @@ from pydantic import BaseModel
 from typing import Optional
 from datetime import date
 
+# Configure logging once for the whole app; modules only create named loggers
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
 # Create tables if they don't exist
 Base.metadata.create_all(bind=engine)
 
@@ -124,7 +128,28 @@ class GameplanRequest(BaseModel):
     as_of_date: date
     window: int = 10
 
-@app.post("/v1/gameplan")
+# Declared response shape: FastAPI validates the plan and serializes it to JSON bytes
+# in pydantic-core instead of going through jsonable_encoder + json.dumps
+class GameplanTip(BaseModel):
+    theme: str
+    text: str
+    score: float
+    evidence: str
+
+class TeamGameplan(BaseModel):
+    win_prob: float
+    tips: list[GameplanTip]
+
+class GameplanFactor(BaseModel):
+    feature: str
+    contribution: float
+
+class GameplanResponse(BaseModel):
+    team_a: TeamGameplan
+    team_b: TeamGameplan
+    top_factors: list[GameplanFactor]
+
+@app.post("/v1/gameplan", response_model=GameplanResponse)
 def get_gameplan(req: GameplanRequest, db: Session = Depends(get_db)):
     """
     Generates matchup-based gameplan tips for both teams.
@@ -143,8 +168,11 @@ def predict(req: PredictionRequest, db: Session = Depends(get_db)):
     Predicts the win probability for the Home Team.
     Fetches features for both teams as of the game_date and runs the ML model.
     """
-    home_feat = get_or_compute_team_features(db, req.home_team_id, req.game_date, req.season, req.window)
-    away_feat = get_or_compute_team_features(db, req.away_team_id, req.game_date, req.season, req.window)
+    feats = get_team_features_bulk(
+        db, [(req.home_team_id, req.game_date), (req.away_team_id, req.game_date)], req.season, req.window
+    )
+    home_feat = feats[(req.home_team_id, req.game_date)]
+    away_feat = feats[(req.away_team_id, req.game_date)]
     
     if not home_feat or not away_feat:
         raise HTTPException(status_code=404, detail="Insufficient data/history for one or both teams to make prediction.")
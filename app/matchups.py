@@ -1,11 +1,32 @@
 import logging
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import select, insert
+import pandas as pd
+import numpy as np
 from .models import TeamGameLog, TeamFeature, Matchup
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# TeamFeature columns copied onto each Matchup as home_* / away_*
+MATCHUP_FEATURES = [
+    'avg_pts', 'avg_fga', 'avg_fg3a', 'avg_fta', 'avg_oreb', 'avg_tov',
+    'avg_poss', 'rate_3pa', 'rate_fta', 'rate_tov'
+]
+
+def _resolve_home_away(matchup_a, matchup_b):
+    """
+    Slow path for matchup strings outside the fixed "ABC vs. XYZ" / "ABC @ XYZ" layout.
+    Returns True if team A is home, False if it is away, None if neither string is recognizable.
+    """
+    for matchup, is_a in ((matchup_a, True), (matchup_b, False)):
+        if not isinstance(matchup, str) or not matchup:
+            continue
+        if "vs." in matchup:
+            return is_a
+        if "@" in matchup:
+            return not is_a
+    return None
+
 def build_matchups_for_season(db: Session, season: str, window: int = 10) -> dict:
     """
     Builds the Matchup dataset for a given season.
@@ -14,7 +35,7 @@ def build_matchups_for_season(db: Session, season: str, window: int = 10) -> dic
     3. Fetches TeamFeatures for both teams as of the game_date.
     4. Inserts into Matchup table.
     """
-    logger.info(f"Building matchups for season {season}")
+    logger.info("Building matchups for season %s", season)
 
     # 1. Fetch all game logs for the season (iterating by game_id)
     # Since we want to process pairs, let's fetch all logs and group in memory 
@@ -22,138 +43,97 @@ def build_matchups_for_season(db: Session, season: str, window: int = 10) -> dic
     # We will query ALL logs. If this is huge, we should paginate. 
     # For now (one season ~2460 rows), memory is fine.
     
-    logs = db.execute(
-        select(TeamGameLog).order_by(TeamGameLog.game_date)
-    ).scalars().all()
-
-    # Group by game_id
-    games_map = {}
-    for log in logs:
-        # Filter by season hack (since we didn't store season in log, we rely on user context or check date)
-        # Assuming the DB has the right data.
-        if log.game_id not in games_map:
-            games_map[log.game_id] = []
-        games_map[log.game_id].append(log)
+    # Only the columns read below, straight into a DataFrame (no ORM hydration)
+    logs_df = pd.read_sql(
+        select(
+            TeamGameLog.game_id,
+            TeamGameLog.team_id,
+            TeamGameLog.game_date,
+            TeamGameLog.matchup,
+            TeamGameLog.wl
+        ).order_by(TeamGameLog.game_date),
+        db.bind
+    )
 
     inserted_count = 0
     skipped_count = 0
-    batch_buffer = []
-    BATCH_SIZE = 100
 
     # Pre-fetch existing matchups to skip
     existing_matchups = set(
-        db.execute(select(Matchup.game_id)).scalars().all()
+        db.execute(select(Matchup.game_id)).scalars()
     )
-
-    for game_id, team_logs in games_map.items():
-        if game_id in existing_matchups:
-            skipped_count += 1
-            continue
-        
-        if len(team_logs) != 2:
-            logger.warning(f"Game {game_id} has {len(team_logs)} logs (expected 2). Skipping.")
-            continue
-
-        # Identify Home vs Away
-        # Convention: "TEAM vs TEAM" is Home. "TEAM @ TEAM" is Away.
-        team_a = team_logs[0]
-        team_b = team_logs[1]
-
-        home_log = None
-        away_log = None
-
-        if "vs." in team_a.matchup:
-            home_log = team_a
-            away_log = team_b
-        elif "@" in team_a.matchup:
-            home_log = team_b
-            away_log = team_a
-        else:
-            # Try the other one
-            if "vs." in team_b.matchup:
-                home_log = team_b
-                away_log = team_a
-            elif "@" in team_b.matchup:
-                home_log = team_a
-                away_log = team_b
-        
-        if not home_log or not away_log:
-            logger.warning(f"Could not determine home/away for {game_id}: {team_a.matchup}, {team_b.matchup}")
-            continue
-
-        # Fetch Features
-        # We need features AS OF game_date.
-        # Note: TeamFeature.as_of_date is the date we 'stand at' to predict.
-        # So we look for TeamFeature where as_of_date == game_date.
-        
-        home_feat = db.scalar(
-            select(TeamFeature).where(
-                TeamFeature.team_id == home_log.team_id,
-                TeamFeature.as_of_date == home_log.game_date,
-                TeamFeature.window == window
-            )
-        )
-
-        away_feat = db.scalar(
-            select(TeamFeature).where(
-                TeamFeature.team_id == away_log.team_id,
-                TeamFeature.as_of_date == away_log.game_date,
-                TeamFeature.window == window
-            )
-        )
-
-        if not home_feat or not away_feat:
-            # We strictly require features. If missing (e.g. first games of season), skip.
-            # This is correct behavior for ML dataset (no rows with null features).
-            skipped_count += 1
+    existing = logs_df['game_id'].isin(existing_matchups)
+    skipped_count += logs_df.loc[existing, 'game_id'].nunique()
+    logs_df = logs_df[~existing]
+
+    # 2. Pair the two logs of each game: after a stable sort by game_id they are adjacent
+    logs_per_game = logs_df.groupby('game_id', sort=False)['team_id'].transform('size')
+    for game_id, n_logs in logs_df.loc[logs_per_game != 2, 'game_id'].value_counts(sort=False).items():
+        logger.warning("Game %s has %d logs (expected 2). Skipping.", game_id, n_logs)
+    paired = logs_df[logs_per_game == 2].sort_values('game_id', kind='stable')
+    team_a = paired.iloc[0::2].reset_index(drop=True)
+    team_b = paired.iloc[1::2].reset_index(drop=True)
+
+    # Identify Home vs Away
+    # Convention: "TEAM vs. TEAM" is Home. "TEAM @ TEAM" is Away.
+    # With 3-letter abbreviations the 5th character alone tells them apart.
+    # a_is_home: 1 = team A home, 0 = team A away, -1 = undetermined
+    marker = team_a['matchup'].str[4]
+    a_is_home = np.where(marker == '@', 0, np.where(marker == 'v', 1, -1))
+    for i in np.flatnonzero(a_is_home == -1):
+        matchup_a, matchup_b = team_a.at[i, 'matchup'], team_b.at[i, 'matchup']
+        resolved = _resolve_home_away(matchup_a, matchup_b)
+        if resolved is None:
+            logger.warning("Could not determine home/away for %s: %s, %s", team_a.at[i, 'game_id'], matchup_a, matchup_b)
             continue
+        a_is_home[i] = int(resolved)
+    keep = a_is_home >= 0
+    a_home = (a_is_home[keep] == 1)[:, None]
+    a_vals, b_vals = team_a[keep].to_numpy(), team_b[keep].to_numpy()
+    home_df = pd.DataFrame(np.where(a_home, a_vals, b_vals), columns=paired.columns)
+    away_df = pd.DataFrame(np.where(a_home, b_vals, a_vals), columns=paired.columns)
+
+    # 3. Attach features AS OF game_date.
+    # Note: TeamFeature.as_of_date is the date we 'stand at' to predict.
+    # So we join on TeamFeature.as_of_date == game_date, once for each side.
+    feats_df = pd.read_sql(
+        select(TeamFeature.team_id, TeamFeature.as_of_date, *[TeamFeature.__table__.c[f] for f in MATCHUP_FEATURES])
+        .where(TeamFeature.window == window),
+        db.bind
+    )
+    games_df = pd.DataFrame({
+        'game_id': home_df['game_id'],
+        'game_date': home_df['game_date'],
+        'season': season,
+        'home_team_id': home_df['team_id'].astype(int),
+        'away_team_id': away_df['team_id'].astype(int),
+        'home_win': (home_df['wl'] == 'W').astype(int),
+        'away_game_date': away_df['game_date'],
+    })
+    # We strictly require features. If missing (e.g. first games of season), skip.
+    # This is correct behavior for ML dataset (no rows with null features).
+    # The inner joins drop those games; the row difference is the skip count.
+    home_feats = feats_df.rename(columns={
+        'team_id': 'home_team_id', 'as_of_date': 'game_date', **{f: f'home_{f}' for f in MATCHUP_FEATURES}
+    })
+    away_feats = feats_df.rename(columns={
+        'team_id': 'away_team_id', 'as_of_date': 'away_game_date', **{f: f'away_{f}' for f in MATCHUP_FEATURES}
+    })
+    out_df = (
+        games_df
+        .merge(home_feats, on=['home_team_id', 'game_date'])
+        .merge(away_feats, on=['away_team_id', 'away_game_date'])
+        .drop(columns='away_game_date')
+    )
+    skipped_count += len(games_df) - len(out_df)
 
-        # Create Matchup Object
-        matchup = Matchup(
-            game_id=game_id,
-            game_date=home_log.game_date,
-            season=season,
-            home_team_id=home_log.team_id,
-            away_team_id=away_log.team_id,
-            home_win=1 if home_log.wl == 'W' else 0,
-            
-            # Home Features
-            home_avg_pts=home_feat.avg_pts,
-            home_avg_fga=home_feat.avg_fga,
-            home_avg_fg3a=home_feat.avg_fg3a,
-            home_avg_fta=home_feat.avg_fta,
-            home_avg_oreb=home_feat.avg_oreb,
-            home_avg_tov=home_feat.avg_tov,
-            home_avg_poss=home_feat.avg_poss,
-            home_rate_3pa=home_feat.rate_3pa,
-            home_rate_fta=home_feat.rate_fta,
-            home_rate_tov=home_feat.rate_tov,
-
-            # Away Features
-            away_avg_pts=away_feat.avg_pts,
-            away_avg_fga=away_feat.avg_fga,
-            away_avg_fg3a=away_feat.avg_fg3a,
-            away_avg_fta=away_feat.avg_fta,
-            away_avg_oreb=away_feat.avg_oreb,
-            away_avg_tov=away_feat.avg_tov,
-            away_avg_poss=away_feat.avg_poss,
-            away_rate_3pa=away_feat.rate_3pa,
-            away_rate_fta=away_feat.rate_fta,
-            away_rate_tov=away_feat.rate_tov
-        )
-        
-        batch_buffer.append(matchup)
-
-        if len(batch_buffer) >= BATCH_SIZE:
-            db.bulk_save_objects(batch_buffer)
-            db.commit()
-            inserted_count += len(batch_buffer)
-            batch_buffer = []
-
-    if batch_buffer:
-        db.bulk_save_objects(batch_buffer)
+    # 4. Single Core executemany with plain dicts (SQLAlchemy batches the VALUES itself);
+    # NULL features stay NULL rather than becoming NaN
+    if not out_df.empty:
+        new_rows = out_df.astype(object).where(out_df.notna(), None).to_dict('records')
+        db.execute(insert(Matchup), new_rows)
         db.commit()
-        inserted_count += len(batch_buffer)
+        inserted_count = len(new_rows)
 
     return {
         "season": season,
@@ -1,7 +1,11 @@
 import logging
+import math
 import joblib
 import pandas as pd
+import numpy as np
 import os
+import threading
+from scipy.special import expit
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 from .models import Matchup
@@ -10,80 +14,186 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import Pipeline
 from sklearn.metrics import accuracy_score, roc_auc_score
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 MODEL_PATH = "model.pkl"
 
+# Model input columns in training order (Matchup minus ids/metadata), resolved once at import
+_NON_FEATURE_COLS = frozenset({'id', 'game_id', 'game_date', 'season', 'home_team_id', 'away_team_id', 'home_win'})
+FEATURE_COLS = tuple(
+    col.name for col in Matchup.__table__.columns
+    if col.name not in _NON_FEATURE_COLS
+)
+
+# Input dicts carry unprefixed TeamFeature keys; model columns are these prefixes + key
+_SIDE_PREFIXES = ("home_", "away_")
+
+# Per-thread input row reused across requests (the scaled result is always a fresh array)
+_SCRATCH = threading.local()
+
+# Loaded model keyed by the model file's mtime, so a retrain is picked up on the next call
+_MODEL_CACHE = {'mtime': None, 'model': None}
+_MODEL_LOCK = threading.Lock()
+
+def make_classifier() -> LogisticRegression:
+    """
+    The win model's estimator, shared by train_model and run_model_evaluation so the
+    evaluation report validates the model that gets shipped.
+    """
+    # liblinear (coordinate descent in C) suits ~20 features x a few thousand games
+    return LogisticRegression(random_state=42, solver='liblinear', C=1.0, max_iter=1000)
+
+def fuse_scaler(scaler: StandardScaler, model: LogisticRegression) -> dict:
+    """
+    Folds a fitted scaler into the fitted logistic layer after it:
+    logit = ((x - mean) / scale) @ coef + intercept = x @ w + b, with w = coef / scale.
+    Returns {w, b, mean_w}; mean_w = mean * w recovers per-feature contributions
+    ((x - mean) / scale * coef = x * w - mean_w).
+    """
+    w = np.ascontiguousarray(model.coef_[0] / scaler.scale_)
+    mean_w = scaler.mean_ * w
+    return {'w': w, 'b': float(model.intercept_[0] - mean_w.sum()), 'mean_w': mean_w}
+
+def _fuse_pipeline(pipeline: Pipeline) -> dict:
+    """
+    fuse_scaler over a fitted scaler -> model Pipeline.
+    """
+    return fuse_scaler(pipeline.named_steps['scaler'], pipeline.named_steps['model'])
+
+def _read_model() -> dict:
+    """
+    Reads MODEL_PATH from disk: the fused-weights dict train_model saves, or a legacy bare
+    pipeline (fused here). Returns {w, b, mean_w, features, index, weights} (see fuse_scaler).
+    index and weights hold one dict per side (home, away), keyed by the unprefixed input key:
+    index -> input position, weights -> w as a Python float.
+    """
+    bundle = joblib.load(MODEL_PATH)
+    if isinstance(bundle, dict):
+        fused, features = bundle, bundle['features']
+    else:
+        # Older model files hold the bare pipeline; fitted on a DataFrame it still records its columns
+        fused = _fuse_pipeline(bundle)
+        features = getattr(bundle, 'feature_names_in_', FEATURE_COLS)
+    features = tuple(str(f) for f in features)
+    w = fused['w'].tolist()
+    sides = [
+        [(name[len(prefix):], i) for i, name in enumerate(features) if name.startswith(prefix)]
+        for prefix in _SIDE_PREFIXES
+    ]
+    return {
+        'w': fused['w'],
+        'b': fused['b'],
+        'mean_w': fused['mean_w'],
+        'features': features,
+        'index': tuple(dict(side) for side in sides),
+        'weights': tuple({key: w[i] for key, i in side} for side in sides),
+    }
+
+def load_model() -> dict:
+    """
+    Returns the model dict (see _read_model), reading the file only when its mtime changes.
+    """
+    try:
+        mtime = os.stat(MODEL_PATH).st_mtime
+    except FileNotFoundError:
+        raise FileNotFoundError("Model not found. Train model first.")
+
+    if _MODEL_CACHE['mtime'] != mtime:
+        # One thread reloads; the rest wait and reuse its result
+        with _MODEL_LOCK:
+            if _MODEL_CACHE['mtime'] != mtime:
+                _MODEL_CACHE['model'] = _read_model()
+                _MODEL_CACHE['mtime'] = mtime
+    return _MODEL_CACHE['model']
+
+def _input_vector(home_features: dict, away_features: dict, model: dict) -> np.ndarray:
+    """
+    Fills this thread's scratch row with the model inputs (home_* then away_*, missing
+    columns 0.0) in the model's feature order. Valid until the thread's next call.
+    """
+    n = len(model['features'])
+    x = getattr(_SCRATCH, 'x', None)
+    if x is None or len(x) != n:
+        x = _SCRATCH.x = np.zeros(n)
+    else:
+        x.fill(0.0)
+    for index, feats in zip(model['index'], (home_features, away_features)):
+        for k, i in index.items():
+            if k in feats: x[i] = feats[k]
+    if not np.isfinite(x).all():
+        raise ValueError("Input X contains NaN.")
+    return x
+
+def score_matchup(home_features: dict, away_features: dict) -> tuple[float, np.ndarray, tuple]:
+    """
+    Home win probability plus each input's contribution to the logit (standardized value * coefficient).
+    Returns (prob, contributions, feature names in contribution order).
+    """
+    model = load_model()
+    x = _input_vector(home_features, away_features, model)
+    prob = float(expit(x @ model['w'] + model['b']))
+    return prob, x * model['w'] - model['mean_w'], model['features']
+
 def train_model(db: Session):
     """
     Trains a Logistic Regression model to predict home_win.
     Uses time-based split (80/20).
-    Saves model pipeline to MODEL_PATH.
+    Saves the fused model weights to MODEL_PATH.
     Returns metrics.
     """
     logger.info("Loading matchups from database...")
     
     # 1. Load Data
-    # Fetch all matchups, sorted by date (CRITICAL for time-series split)
-    query = select(Matchup).order_by(Matchup.game_date)
-    matchups = db.execute(query).scalars().all()
-    
-    if not matchups:
-        logger.error("No matchups found in DB. Cannot train.")
-        return None
-
-    # Convert to DataFrame
-    data = []
-    # Identify feature columns dynamically (excluding IDs/metadata)
-    # Metadata: id, game_id, game_date, season, home_team_id, away_team_id, home_win
-    # Features: everything else
-    feature_cols = [
-        col.name for col in Matchup.__table__.columns 
-        if col.name not in ['id', 'game_id', 'game_date', 'season', 'home_team_id', 'away_team_id', 'home_win']
-    ]
-    
-    for m in matchups:
-        row = {col: getattr(m, col) for col in feature_cols}
-        row['home_win'] = m.home_win
-        row['game_date'] = m.game_date # Keep for debug if needed, but implicit order is key
-        data.append(row)
-        
-    df = pd.DataFrame(data)
-    
-    # Drop rows with NaN if any (shouldn't be based on builder logic, but safe check)
-    df = df.dropna()
+    # Fetch feature columns + label for all matchups, sorted by date (CRITICAL for time-series split),
+    # straight into a DataFrame (no per-row ORM objects or dicts)
+    # Rows with a missing value (shouldn't be based on builder logic, but safe check): NULLs are
+    # filtered by the query, stored NaNs (which IS NOT NULL lets through) are masked out below
+    feature_cols = list(FEATURE_COLS)
+    columns = [Matchup.__table__.c[col] for col in feature_cols + ['home_win']]
+    query = select(*columns).where(*[col.is_not(None) for col in columns]).order_by(Matchup.game_date)
+    df = pd.read_sql(query, db.bind)
+
+    # Row-major float32 matrix: LogisticRegression.fit validates its input in C order, so a
+    # column-major layout would only be copied back after scaling
+    X = np.ascontiguousarray(df[feature_cols].to_numpy(dtype=np.float32))
+    y = df['home_win'].to_numpy()
+    keep = ~np.isnan(X).any(axis=1)
+    if not keep.all():
+        X, y = X[keep], y[keep]
     
-    if df.empty:
+    if len(X) == 0:
+        if db.execute(select(Matchup.id).limit(1)).first() is None:
+            logger.error("No matchups found in DB. Cannot train.")
+            return None
         return {"error": "No valid data after dropping NaNs"}
-
-    X = df[feature_cols]
-    y = df['home_win']
     
     # 2. Time-Based Split
     # First 80% train, Last 20% test
-    split_idx = int(len(df) * 0.8)
-    X_train, X_test = X.iloc[:split_idx], X.iloc[split_idx:]
-    y_train, y_test = y.iloc[:split_idx], y.iloc[split_idx:]
+    split_idx = int(len(X) * 0.8)
+    X_train, X_test = X[:split_idx], X[split_idx:]
+    y_train, y_test = y[:split_idx], y[split_idx:]
     
     logger.info(f"Training on {len(X_train)} games, Testing on {len(X_test)} games")
     
     # 3. Pipeline: Scaling -> Model
     pipeline = Pipeline([
         ('scaler', StandardScaler()),
-        ('model', LogisticRegression(random_state=42))
+        ('model', make_classifier())
     ])
     
     # 4. Train
     pipeline.fit(X_train, y_train)
     
     # 5. Evaluate
-    y_pred = pipeline.predict(X_test)
-    y_proba = pipeline.predict_proba(X_test)[:, 1] # Probability of Class 1 (Home Win)
+    # Logits straight from the fused weights (no Pipeline input validation or scaled copy of
+    # X_test): the class is their sign, and AUC only needs the ranking, which the sigmoid preserves
+    fused = _fuse_pipeline(pipeline)
+    scores = X_test @ fused['w'] + fused['b'] # Home-win logit
+    y_pred = (scores > 0).astype(int)
     
     acc = accuracy_score(y_test, y_pred)
     try:
-        auc = roc_auc_score(y_test, y_proba)
+        auc = roc_auc_score(y_test, scores)
     except ValueError:
         auc = 0.0 # Handle case with one class in test set
         
@@ -91,8 +201,12 @@ def train_model(db: Session):
     
     logger.info(f"Model Trained. Accuracy: {acc:.4f}, AUC: {auc:.4f}, Baseline Home Win%: {baseline_win_rate:.4f}")
     
-    # 6. Save
-    joblib.dump(pipeline, MODEL_PATH)
+    # 6. Save the scaler-fused weights (with the input column order, so prediction doesn't depend
+    # on the table schema). Written beside MODEL_PATH and swapped in, so load_model never reads a
+    # half-written file
+    tmp_path = f"{MODEL_PATH}.tmp"
+    joblib.dump({**fused, 'features': feature_cols}, tmp_path)
+    os.replace(tmp_path, MODEL_PATH)
     logger.info(f"Model saved to {MODEL_PATH}")
     
     return {
@@ -103,57 +217,48 @@ def train_model(db: Session):
         "test_size": len(X_test)
     }
 
+def _sigmoid(z: float) -> float:
+    """
+    Logistic function on a Python float, split on the sign of z so exp never overflows.
+    """
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
 def predict_win_probability(home_features: dict, away_features: dict) -> float:
     """
     Predicts probability of Home Team winning.
     """
-    if not os.path.exists(MODEL_PATH):
-        raise FileNotFoundError("Model not found. Train model first.")
-        
-    pipeline = joblib.load(MODEL_PATH)
-    
-    # Construct input vector in same order as training
-    # We essentially need to map the dict keys to the feature columns expected by the model
-    # The model expects [home_avg_pts, ..., away_avg_pts, ...]
-    
-    # Helper to map standard feature names (from TeamFeature) to Matchup column names
-    # Matchup cols: home_avg_pts, away_avg_pts
-    # Input dict keys: avg_pts, ...
-    
-    input_data = {}
-    
-    # Map Home Features
-    for k, v in home_features.items():
-        if k in ['team_id', 'as_of_date', 'season', 'window', 'games_used', 'id']:
-            continue
-        col_name = f"home_{k}"
-        input_data[col_name] = v
-        
-    # Map Away Features
-    for k, v in away_features.items():
-        if k in ['team_id', 'as_of_date', 'season', 'window', 'games_used', 'id']:
-            continue
-        col_name = f"away_{k}"
-        input_data[col_name] = v
-
-    # Ensure we use the exact same columns as training
-    # In production, we'd store feature names in the pipeline metadata. 
-    # For now, we reconstruct the list from the Matchup model (safe assumption as code & DB are synced)
-    feature_cols = [
-        col.name for col in Matchup.__table__.columns 
-        if col.name not in ['id', 'game_id', 'game_date', 'season', 'home_team_id', 'away_team_id', 'home_win']
-    ]
-    
-    # Create DataFrame for prediction (handles ordering)
-    df = pd.DataFrame([input_data])
-    
-    # Add missing cols with 0 if any (robustness), though keys should match
-    for col in feature_cols:
-        if col not in df.columns:
-            df[col] = 0.0
-            
-    # Order columns
-    df = df[feature_cols]
-    
-    prob_home_win = pipeline.predict_proba(df)[0][1]
-    return float(prob_home_win)
+    # With the scaler folded into the weights the logit is ~20 multiply-adds; plain float
+    # arithmetic over the input dicts beats building an array for NumPy to dispatch on
+    model = load_model()
+    logit = model['b']
+    for weights, feats in zip(model['weights'], (home_features, away_features)):
+        for k, w in weights.items():
+            if k not in feats: continue
+            v = feats[k]
+            # A missing value (None) is as unusable as NaN
+            if v is None: raise ValueError("Input X contains NaN.")
+            logit += w * v
+    if not math.isfinite(logit):
+        raise ValueError("Input X contains NaN.")
+    return _sigmoid(logit)
+
+def predict_win_probabilities(home_df: pd.DataFrame, away_df: pd.DataFrame) -> np.ndarray:
+    """
+    Predicts home win probabilities for a slate of games in one matrix product.
+    Row i of home_df (feature columns as in TeamFeature) plays row i of away_df.
+    """
+    if len(home_df) != len(away_df):
+        raise ValueError(f"home_df has {len(home_df)} rows but away_df has {len(away_df)}; expected one row per game in each.")
+    model = load_model()
+    X = pd.concat(
+        [home_df.add_prefix('home_').reset_index(drop=True), away_df.add_prefix('away_').reset_index(drop=True)],
+        axis=1
+    )
+    # Model columns in training order; absent ones count as 0.0 like the single-game path
+    X = X.reindex(columns=list(model['features']), fill_value=0.0).to_numpy(dtype=np.float64)
+    if not np.isfinite(X).all():
+        raise ValueError("Input X contains NaN.")
+    return expit(X @ model['w'] + model['b'])
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, Float, Numeric, PrimaryKeyConstraint
+from sqlalchemy import Column, Integer, SmallInteger, String, Date, Float, Numeric, PrimaryKeyConstraint
 import sqlalchemy
 from .db import Base
 
@@ -13,30 +13,32 @@ class TeamGameLog(Base):
     matchup = Column(String)
     wl = Column(String)  # W or L
 
-    # Base Stats
-    pts = Column(Integer)
-    fgm = Column(Integer)
-    fga = Column(Integer)
+    # Base Stats (box-score counts fit in 2-byte SmallInteger)
+    pts = Column(SmallInteger)
+    fgm = Column(SmallInteger)
+    fga = Column(SmallInteger)
     fg_pct = Column(Float)
-    fg3m = Column(Integer)
-    fg3a = Column(Integer)
+    fg3m = Column(SmallInteger)
+    fg3a = Column(SmallInteger)
     fg3_pct = Column(Float)
-    ftm = Column(Integer)
-    fta = Column(Integer)
+    ftm = Column(SmallInteger)
+    fta = Column(SmallInteger)
     ft_pct = Column(Float)
-    oreb = Column(Integer)
-    dreb = Column(Integer)
-    reb = Column(Integer)
-    ast = Column(Integer)
-    stl = Column(Integer)
-    blk = Column(Integer)
-    tov = Column(Integer)
-    pf = Column(Integer)
+    oreb = Column(SmallInteger)
+    dreb = Column(SmallInteger)
+    reb = Column(SmallInteger)
+    ast = Column(SmallInteger)
+    stl = Column(SmallInteger)
+    blk = Column(SmallInteger)
+    tov = Column(SmallInteger)
+    pf = Column(SmallInteger)
     plus_minus = Column(Float)
 
     # Ensure uniqueness on game_id and team_id at DB level
+    # (team_id, game_date) serves the per-team chronological scans in the feature builders
     __table_args__ = (
         PrimaryKeyConstraint('game_id', 'team_id'),
+        sqlalchemy.Index('ix_team_game_log_team_date', 'team_id', 'game_date'),
     )
 
 class TeamFeature(Base):
@@ -63,9 +65,11 @@ class TeamFeature(Base):
     rate_fta = Column(Float)
     rate_tov = Column(Float)
 
-    # Unique constraint on (team_id, as_of_date, window)
+    # Unique constraint on (team_id, as_of_date, window); its index also serves point lookups.
+    # (season, window) serves the per-season scans (baselines, matchup preload)
     __table_args__ = (
         sqlalchemy.UniqueConstraint('team_id', 'as_of_date', 'window', name='uq_team_feature'),
+        sqlalchemy.Index('ix_team_feature_season_window', 'season', 'window'),
     )
 
 class Matchup(Base):
@@ -122,9 +126,11 @@ class TeamDefFeature(Base):
     def_rate_fta_allowed = Column(Float)
     def_rate_tov_forced = Column(Float)
 
-    # Unique constraint on (team_id, as_of_date, window)
+    # Unique constraint on (team_id, as_of_date, window); its index also serves point lookups.
+    # (season, window) serves the per-season scans (baselines)
     __table_args__ = (
         sqlalchemy.UniqueConstraint('team_id', 'as_of_date', 'window', name='uq_team_def_feature'),
+        sqlalchemy.Index('ix_team_def_feature_season_window', 'season', 'window'),
     )
 
 class SeasonFeatureBaseline(Base):
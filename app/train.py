@@ -1,7 +1,9 @@
+import logging
 from .db import SessionLocal
 from .ml import train_model
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     db = SessionLocal()
     try:
         print("Starting training...")